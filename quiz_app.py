@@ -1,12 +1,15 @@
 import streamlit as st
 import pandas as pd
-import random
+import numpy as np
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import html
 import json
+import logging
+import math
+import queue
+import threading
 import time
-import plotly.express as px
-from streamlit_autorefresh import st_autorefresh
+import plotly.graph_objects as go
 
 # ---------------------------
 # MOBILE-FRIENDLY CSS
@@ -18,6 +21,8 @@ st.markdown(
     div[role="radiogroup"] label { font-size: 20px; padding: 10px 0;}
     .timer { font-size: 22px; font-weight: bold; margin-bottom: 10px; }
     button[kind="secondary"] { padding: 12px 20px !important; font-size: 18px !important; }
+    .card { padding: 12px; border-radius: 12px; margin-bottom: 6px; box-shadow: 2px 2px 8px rgba(0,0,0,0.1); }
+    .crown { margin-left: 4px; }
     </style>
     """,
     unsafe_allow_html=True
@@ -27,75 +32,249 @@ st.markdown(
 # CONFIG: Google Sheets Setup
 # ---------------------------
 SHEET_URL = "https://docs.google.com/spreadsheets/d/YOUR_SHEET_ID_HERE/edit#gid=0"
+LEADERBOARD_COLUMNS = ["Name", "Score", "Total", "Percentage"]
+NUMERIC_COLUMNS = ["Score", "Total", "Percentage"]
+TIME_LIMIT = 15  # seconds per question
+# Pastel card backgrounds, one per leaderboard rank
+CARD_COLORS = (
+    "rgb(200,220,255)",
+    "rgb(220,255,200)",
+    "rgb(255,230,190)",
+    "rgb(240,200,255)",
+    "rgb(190,245,240)"
+)
+CARD_TMPL = (
+    "<div class='card' style='background:{color}'>"
+    "<b>#{rank} {name}{crown}</b><br>"
+    "Score: {score} / {total} &nbsp; | &nbsp; Percentage: {percentage}%"
+    "</div>"
+)
+# Fixed Viridis stops, one per leaderboard rank (first place first)
+CHART_COLORS = ("#440154", "#3b528b", "#21918c", "#5ec962", "#fde725")
 
+@st.cache_resource
 def authenticate_google_sheets():
-    # Load credentials from Streamlit secrets
+    # Load credentials from Streamlit secrets (authorized once, reused across reruns)
     creds_dict = json.loads(st.secrets["gcp_service_account"]["creds"])
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(
-        creds_dict,
-        ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    )
-    client = gspread.authorize(creds)
+    client = gspread.service_account_from_dict(creds_dict)
     sheet = client.open_by_url(SHEET_URL).sheet1
     return sheet
 
 # ---------------------------
 # Google Sheets Functions
 # ---------------------------
-def save_score(name, score, total):
+def score_writer_loop(sheet, writer):
+    while True:
+        row, receipt = writer["queue"].get()
+        try:
+            # INSERT_ROWS inserts a fresh row instead of overwriting cells below the table;
+            # RAW is already gspread's default and is only spelled out for clarity
+            sheet.append_row(
+                row,
+                value_input_option="RAW",
+                insert_data_option="INSERT_ROWS",
+                table_range="A1"
+            )
+            # Bumping the count changes load_leaderboard's cache key, so the next
+            # fetch is guaranteed to start after this row landed
+            writer["writes"] += 1
+        except Exception:
+            logging.exception("Failed to save score row %r", row)
+            receipt["failed"] = True
+        finally:
+            receipt["done"].set()
+            writer["queue"].task_done()
+
+@st.cache_resource
+def get_score_writer():
+    # One daemon writer per server process, so Sheets appends never block a rerun.
+    # "writes" counts landed appends; only the writer thread increments it.
+    writer = {"queue": queue.Queue(), "writes": 0}
     sheet = authenticate_google_sheets()
-    percentage = round((score / total) * 100, 2)
-    sheet.append_row([name, score, total, percentage])
+    threading.Thread(target=score_writer_loop, args=(sheet, writer), daemon=True).start()
+    return writer
 
-def load_leaderboard():
+def save_score(name, score, total):
+    percentage = round((score / total) * 100, 2)
+    # Rows are cumulative, so this session only needs to track its latest write
+    receipt = {"done": threading.Event(), "failed": False}
+    get_score_writer()["queue"].put_nowait(([name, score, total, percentage], receipt))
+    st.session_state.last_save = receipt
+
+def flush_scores(timeout=10):
+    # Wait for this session's last write only, not every user's queued rows
+    receipt = st.session_state.get("last_save")
+    if receipt is not None:
+        receipt["done"].wait(timeout)
+    return receipt
+
+@st.cache_data(ttl=10, max_entries=4, show_spinner=False)
+def load_leaderboard(writes):
+    # `writes` is only a cache key: a fetch started before a write can never
+    # be served for a later write count
     sheet = authenticate_google_sheets()
-    data = sheet.get_all_records()
-    if data:
-        return pd.DataFrame(data)
+    rows = sheet.get_all_values()
+    if len(rows) > 1:
+        # Build the frame straight from the 2-D values list (no per-row dicts)
+        df = pd.DataFrame(rows[1:], columns=rows[0])
+        df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].apply(pd.to_numeric, downcast="integer")
+        return df
     else:
-        return pd.DataFrame(columns=["Name", "Score", "Total", "Percentage"])
+        return pd.DataFrame(columns=LEADERBOARD_COLUMNS)
+
+def rank_players(leaderboard):
+    # Scores are saved cumulatively after every answer, so keep each player's
+    # latest row (their final result), then sort stably so ties keep sheet order
+    if leaderboard.empty:
+        return leaderboard.assign(rank=pd.Series(dtype="int64"))
+    ranked = leaderboard.drop_duplicates("Name", keep="last").sort_values(
+        by=["Score", "Percentage"], ascending=[False, False], kind="stable"
+    )
+    ranked["rank"] = np.arange(1, len(ranked) + 1)
+    return ranked
+
+def top_players(leaderboard, n=5):
+    # Partial selection over each player's latest row instead of a full sort;
+    # empty frames have object dtypes
+    if leaderboard.empty:
+        return leaderboard
+    latest = leaderboard.drop_duplicates("Name", keep="last")
+    return latest.nlargest(n, ["Score", "Percentage"])
 
 # ---------------------------
-# Plotly Global Ranking Chart
+# Top 5 Player Cards
 # ---------------------------
-def show_leaderboard_chart(top_players_df):
+def show_top_players(top_players_df):
     if top_players_df.empty:
-        st.write("No scores yet. Be the first to play!")
         return
 
-    fig = px.bar(
-        top_players_df[::-1],
-        x="Score",
-        y="Name",
-        orientation='h',
-        text="Score",
-        color="Percentage",
-        color_continuous_scale="Viridis",
-        labels={"Score": "Score", "Name": "Player", "Percentage": "Percentage %"}
+    # One markdown call for all cards instead of one per player
+    cards = "".join(
+        CARD_TMPL.format_map({
+            "color": CARD_COLORS[i-1],
+            "rank": i,
+            "name": html.escape(str(row.Name)),
+            "crown": "<span class='crown'>👑</span>" if i == 1 else "",
+            "score": row.Score,
+            "total": row.Total,
+            "percentage": row.Percentage
+        })
+        for i, row in enumerate(top_players_df.itertuples(), 1)
+    )
+    st.markdown(cards, unsafe_allow_html=True)
+
+# ---------------------------
+# Plotly Global Ranking Chart
+# ---------------------------
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_leaderboard_figure(names, scores, percentages):
+    # Keyed on plain tuples, so an unchanged top 5 reuses the cached figure
+    # Reverse so the leader is drawn at the top of the horizontal chart
+    names, scores = names[::-1], scores[::-1]
+    colors = CHART_COLORS[:len(names)][::-1]
+    fig = go.Figure(
+        go.Bar(
+            x=scores,
+            y=names,
+            orientation='h',
+            text=scores,
+            marker_color=colors,
+            customdata=percentages[::-1],
+            hovertemplate="%{y}: %{x} (%{customdata}%)<extra></extra>"
+        )
     )
     fig.update_layout(
-        xaxis=dict(range=[0, top_players_df["Score"].max() + 1]),
+        xaxis=dict(range=[0, max(scores) + 1], title="Score"),
+        yaxis=dict(title="Player"),
+        showlegend=False,
         margin=dict(l=50, r=50, t=50, b=50),
         height=400
     )
+    return fig.to_dict()
+
+def show_leaderboard_chart(top_players_df):
+    if top_players_df.empty:
+        st.write("No scores yet. Be the first to play!")
+        return
+
+    fig = build_leaderboard_figure(
+        tuple(top_players_df["Name"]),
+        tuple(top_players_df["Score"]),
+        tuple(top_players_df["Percentage"])
+    )
     st.plotly_chart(fig, use_container_width=True)
 
 # ---------------------------
 # Load Quiz Questions
 # ---------------------------
-@st.cache_data
+@st.cache_resource
 def load_questions():
-    df = pd.read_csv("questions.csv")
-    return df.to_dict(orient="records")
+    # PyArrow parser and Arrow-backed strings for a faster cold start
+    df = pd.read_csv("questions.csv", engine="pyarrow", dtype_backend="pyarrow")
+    # Split options once at load time instead of on every rerun
+    df["options"] = df["options"].str.split(";").map(tuple)
+    return list(df[["question", "options", "answer"]].itertuples(index=False, name="Question"))
 
 # ---------------------------
-# Helper: Random Color
+# Load Sound Effects
 # ---------------------------
-def random_color():
-    r = random.randint(150, 255)
-    g = random.randint(150, 255)
-    b = random.randint(150, 255)
-    return f'rgb({r},{g},{b})'
+@st.cache_data(show_spinner=False)
+def load_audio(path):
+    # Read each static clip from disk once and serve the cached bytes
+    with open(path, "rb") as f:
+        return f.read()
+
+# ---------------------------
+# Question Timer
+# ---------------------------
+@st.fragment(run_every="1s")
+def question_timer(q, q_index, answer_key):
+    # Absolute deadline on the monotonic clock, immune to wall-clock jumps
+    deadline_key = f"deadline_{q_index}"
+    if deadline_key not in st.session_state:
+        st.session_state[deadline_key] = time.monotonic() + TIME_LIMIT
+
+    remaining = max(0, math.ceil(st.session_state[deadline_key] - time.monotonic()))
+    color = "red" if remaining <= 5 else "black"
+    st.markdown(
+        f"<div class='timer' style='color:{color}'>⏱️ Time left: <b>{remaining} sec</b></div>",
+        unsafe_allow_html=True
+    )
+
+    # Auto-submit if time is up
+    if remaining == 0:
+        if st.session_state[answer_key] == q.answer:
+            st.success("✅ Correct!")
+            st.balloons()
+            st.session_state.score += 1
+        else:
+            st.error(f"❌ Time’s up! Correct answer: {q.answer}")
+
+        # Save score immediately
+        save_score(st.session_state.player_name, st.session_state.score, q_index + 1)
+
+        # Increment question and rerun the full app
+        st.session_state.current_q += 1
+        st.rerun()
+
+# ---------------------------
+# Leaderboard Panel
+# ---------------------------
+def leaderboard_panel():
+    # Refetch only once a score write has landed; other reruns redraw the last top 5.
+    # No polling: a write that lands after the submit rerun shows on the next full rerun.
+    writes = get_score_writer()["writes"]
+    if st.session_state.get("lb_writes") != writes:
+        st.session_state.lb_top5 = top_players(load_leaderboard(writes))
+        st.session_state.lb_writes = writes
+    top5 = st.session_state.lb_top5
+
+    st.subheader("🏆 Top 5 Players So Far")
+    show_top_players(top5)
+
+    # Show chart
+    st.subheader("📊 Top Players - Visual Ranking")
+    show_leaderboard_chart(top5)
 
 # ---------------------------
 # Main Quiz App
@@ -104,9 +283,6 @@ def run_quiz():
     st.title("🌍 World Data Quiz")
     st.write("Test your knowledge of world geography, culture, and data!")
 
-    # Auto-refresh every 5 seconds (optional)
-    st_autorefresh(interval=5000, limit=None, key="quiz_autorefresh")
-
     # Player Name Input (session_state-safe)
     if "player_name" not in st.session_state:
         st.session_state.player_name = st.text_input("Enter your name to start:")
@@ -117,134 +293,84 @@ def run_quiz():
 
     # Load and Shuffle Questions
     questions = load_questions()
-    if "shuffled_questions" not in st.session_state:
-        st.session_state.shuffled_questions = random.sample(questions, len(questions))
+    if "q_order" not in st.session_state:
+        # Shuffle indices into the shared cached list instead of copying the questions
+        q_order = np.arange(len(questions))
+        np.random.default_rng().shuffle(q_order)
+        st.session_state.q_order = q_order
+        st.session_state.total_q = len(questions)
         st.session_state.current_q = 0
         st.session_state.score = 0
-        st.session_state.colors = [random_color() for _ in range(5)]
+
+    total_q = st.session_state.total_q
+    if total_q == 0:
+        st.warning("No questions available.")
+        return
 
     q_index = st.session_state.current_q
 
     # Show progress bar
-    progress = (q_index / len(st.session_state.shuffled_questions))
+    progress = q_index / total_q
     st.progress(progress)
-    st.caption(f"Question {q_index + 1} of {len(st.session_state.shuffled_questions)}")
-
-    # ---------------------------
-    # Quiz Question
-    # ---------------------------
-    if q_index < len(st.session_state.shuffled_questions):
-        q = st.session_state.shuffled_questions[q_index]
-        st.subheader(q["question"])
-
-        options = q["options"].split(";")
-        answer_key = f"answer_{q_index}"
-        if answer_key not in st.session_state:
-            st.session_state[answer_key] = None
-
-        selected_answer = st.radio("Choose your answer:", options, key=answer_key)
-
-        # Non-blocking timer
-        time_limit = 15
-        if f"timer_{q_index}" not in st.session_state:
-            st.session_state[f"timer_{q_index}"] = time_limit
-            st.session_state[f"timer_start_{q_index}"] = time.time()
-
-        elapsed = int(time.time() - st.session_state[f"timer_start_{q_index}"])
-        remaining = max(time_limit - elapsed, 0)
-        color = "red" if remaining <= 5 else "black"
-        st.markdown(
-            f"<div class='timer' style='color:{color}'>⏱️ Time left: <b>{remaining} sec</b></div>",
-            unsafe_allow_html=True
-        )
-
-        # Auto-submit if time is up
-        if remaining == 0:
-            if st.session_state[answer_key] == q["answer"]:
-                st.success("✅ Correct!")
-                st.balloons()
-                st.session_state.score += 1
-            else:
-                st.error(f"❌ Time’s up! Correct answer: {q['answer']}")
-
-            # Save score immediately
-            save_score(st.session_state.player_name, st.session_state.score, q_index + 1)
-
-            # Increment question
-            st.session_state.current_q += 1
-            st.experimental_rerun()
-
-        # Manual Submit Button
-        if st.button("Submit Answer"):
-            if st.session_state[answer_key] == q["answer"]:
-                st.success("✅ Correct!")
-                st.balloons()
-                st.session_state.score += 1
-            else:
-                st.error(f"❌ Wrong! Correct answer: {q['answer']}")
-
-            save_score(st.session_state.player_name, st.session_state.score, q_index + 1)
-            st.session_state.current_q += 1
-            st.experimental_rerun()
-
-        # Dynamic Top 5 leaderboard
-        st.subheader("🏆 Top 5 Players So Far")
-        leaderboard = load_leaderboard()
-        leaderboard = leaderboard.sort_values(by=["Score", "Percentage"], ascending=[False, False])
-        top5 = leaderboard.head(5)
-
-        if not top5.empty:
-            for i, row in enumerate(top5.itertuples(), 1):
-                crown = " 👑" if i == 1 else ""
-                color = st.session_state.colors[i-1] if i-1 < len(st.session_state.colors) else random_color()
-                st.markdown(
-                    f"""
-                    <div style='background-color:{color};padding:12px;border-radius:12px;margin-bottom:6px;
-                    box-shadow: 2px 2px 8px rgba(0,0,0,0.1);'>
-                        <b>#{i} {row.Name}{crown}</b><br>
-                        Score: {row.Score} / {row.Total} &nbsp; | &nbsp; Percentage: {row.Percentage}%
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-
-        # Show chart
-        st.subheader("📊 Top Players - Visual Ranking")
-        show_leaderboard_chart(top5)
 
     # ---------------------------
     # Quiz Completed
     # ---------------------------
-    else:
+    if q_index >= total_q:
         st.balloons()
-        st.audio("cheer.mp3", format="audio/mp3")
+        st.audio(load_audio("cheer.mp3"), format="audio/mp3")
         st.success("🎉 Quiz Completed!")
-        total = len(st.session_state.shuffled_questions)
         score = st.session_state.score
-        percentage = round((score / total) * 100, 2)
+        percentage = round((score / total_q) * 100, 2)
 
-        st.write(f"**Your Score:** {score}/{total}")
+        st.write(f"**Your Score:** {score}/{total_q}")
         st.write(f"**Percentage:** {percentage}%")
 
-        # Final leaderboard
-        leaderboard = load_leaderboard()
-        leaderboard = leaderboard.sort_values(by=["Score", "Percentage"], ascending=[False, False])
-        top5 = leaderboard.head(5)
-
-        if not top5.empty:
-            for i, row in enumerate(top5.itertuples(), 1):
-                crown = " 👑" if i == 1 else ""
-                color = st.session_state.colors[i-1] if i-1 < len(st.session_state.colors) else random_color()
-                st.markdown(
-                    f"""
-                    <div style='background-color:{color};padding:12px;border-radius:12px;margin-bottom:6px;
-                    box-shadow: 2px 2px 8px rgba(0,0,0,0.1);'>
-                        <b>#{i} {row.Name}{crown}</b><br>
-                        Score: {row.Score} / {row.Total} &nbsp; | &nbsp; Percentage: {row.Percentage}%
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+        # Final leaderboard: one sort feeds both the top 5 and the player's rank
+        receipt = flush_scores()
+        if receipt is not None and not receipt["done"].is_set():
+            st.info("Your score is still being saved; the ranking may not include it yet.")
+        elif receipt is not None and receipt["failed"]:
+            st.error("⚠️ Your score could not be saved to the leaderboard.")
+        ranked = rank_players(load_leaderboard(get_score_writer()["writes"]))
+        player_rank = ranked.loc[ranked["Name"] == st.session_state.player_name, "rank"]
+        if not player_rank.empty:
+            st.write(f"**Your Rank:** #{player_rank.iat[0]} of {len(ranked)} players")
+
+        show_top_players(ranked.head(5))
+        return
+
+    # ---------------------------
+    # Quiz Question
+    # ---------------------------
+    st.caption(f"Question {q_index + 1} of {total_q}")
+    q = questions[st.session_state.q_order[q_index]]
+    st.subheader(q.question)
+
+    answer_key = f"answer_{q_index}"
+    if answer_key not in st.session_state:
+        st.session_state[answer_key] = None
+
+    selected_answer = st.radio("Choose your answer:", q.options, key=answer_key)
+
+    # Non-blocking timer (reruns on its own, not the whole page)
+    question_timer(q, q_index, answer_key)
+
+    # Manual Submit Button
+    if st.button("Submit Answer"):
+        if st.session_state[answer_key] == q.answer:
+            st.success("✅ Correct!")
+            st.balloons()
+            st.session_state.score += 1
+        else:
+            st.error(f"❌ Wrong! Correct answer: {q.answer}")
+
+        save_score(st.session_state.player_name, st.session_state.score, q_index + 1)
+        st.session_state.current_q += 1
+        st.rerun()
+
+    # Dynamic Top 5 leaderboard
+    leaderboard_panel()
 
 # ---------------------------
 # RUN THE APP